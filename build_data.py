@@ -0,0 +1,103 @@
+import os
+import tempfile
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# --- Build the Joined Dataset ---
+# Run once at deploy time (python build_data.py) to write joined.parquet,
+# the single file the Streamlit app reads. The app only rebuilds it itself
+# when it is missing or older than its sources.
+
+# Columns read from each source table; the surrogate ids only link the
+# star schema together, so only fact_id is kept
+USED_COLS = {
+    "marketing": ["fact_id", "subscribed"],
+    "client": ["age", "job", "marital", "education", "credit_default", "housing", "loan", "age_group"],
+    "contact": ["contact", "month", "day", "duration", "duration_length"],
+    "campaign": ["campaign", "pdays", "previous", "poutcome"],
+}
+SOURCE_FILES = [f"{table}.parquet" for table in USED_COLS]
+JOINED_FILE = "joined.parquet"
+# Most often filtered on, so they lead the file
+LEADING_COLUMNS = ["age_group", "subscribed"]
+# Low-cardinality labels, stored as categoricals so the file carries them
+# dictionary-encoded and readers get integer codes, not Python strings
+CATEGORY_COLUMNS = ["job", "marital", "education", "age_group", "month", "contact", "poutcome", "duration_length"]
+
+def build_joined(force=False):
+    # Join the tables once and keep the result on disk; rebuilt only
+    # when a source file (or this script) is newer than the joined copy.
+    # Returns the file's mtime, which callers use as a cache key.
+    if not force and os.path.exists(JOINED_FILE) and all(
+        os.path.getmtime(JOINED_FILE) >= os.path.getmtime(f) for f in SOURCE_FILES + [__file__]
+    ):
+        return os.path.getmtime(JOINED_FILE)
+    # Join all tables into one dataframe; DuckDB hash-joins the Parquet
+    # files directly, decoding only the listed columns. Rows are sorted on
+    # age_group so each row group's min/max statistics stay tight for the
+    # age-group filter's predicate pushdown.
+    columns = ", ".join(f"{table}.{c}" for table, cols in USED_COLS.items() for c in cols)
+    joins = " ".join(
+        f"LEFT JOIN read_parquet('{table}.parquet') {table} ON marketing.fact_id = {table}.fact_id"
+        for table in USED_COLS if table != "marketing"
+    )
+    with duckdb.connect() as con:
+        joined = con.execute(f"""
+            SELECT {columns}
+            FROM read_parquet('marketing.parquet') marketing
+            {joins}
+            ORDER BY client.age_group, marketing.fact_id
+        """).fetch_arrow_table()
+    df = joined.to_pandas(self_destruct=True, split_blocks=True)
+
+    # Normalize subscribed to bool once, deciding from the dtype alone; the
+    # raw 'deposit' field may also come through as yes/no text
+    if pd.api.types.is_string_dtype(df['subscribed']):
+        df['subscribed'] = df['subscribed'].str.lower().eq('yes')
+    elif not pd.api.types.is_bool_dtype(df['subscribed']):
+        df['subscribed'] = df['subscribed'].astype(bool)
+
+    for c in CATEGORY_COLUMNS:
+        df[c] = df[c].astype("category")
+
+    # Readable outcome label built from the boolean as category codes
+    df['subscribed_label'] = pd.Categorical.from_codes(
+        df['subscribed'].to_numpy(dtype='uint8'), categories=['Not Subscribed', 'Subscribed']
+    )
+
+    df = df[LEADING_COLUMNS + [c for c in df.columns if c not in LEADING_COLUMNS]]
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Write to a temp file of this build's own first, so readers never see a
+    # partial file and concurrent builds never write over each other
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(os.path.abspath(JOINED_FILE)), prefix="joined.", suffix=".parquet.tmp", delete=False
+    ) as tmp:
+        tmp_file = tmp.name
+    try:
+        pq.write_table(
+            table,
+            tmp_file,
+            compression="zstd",
+            compression_level=6,
+            use_dictionary=True,
+            write_statistics=True,
+            row_group_size=131072,
+            sorting_columns=[pq.SortingColumn(table.schema.get_field_index("age_group"))],
+        )
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+    # Temp files are created private; give the data file the usual mode
+    os.chmod(tmp_file, 0o644)
+    os.replace(tmp_file, JOINED_FILE)
+    return os.path.getmtime(JOINED_FILE)
+
+if __name__ == "__main__":
+    # Copy-on-Write: build_joined's column reassignments share buffers instead
+    # of making defensive copies. Always on (and the option deprecated) from pandas 3.0.
+    if int(pd.__version__.split(".")[0]) < 3:
+        pd.set_option("mode.copy_on_write", True)
+    build_joined(force=True)
+    print(f"Wrote {JOINED_FILE}")
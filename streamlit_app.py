@@ -1,152 +1,309 @@
+import re
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import sqlite3
-from io import StringIO
+import numpy as np
+import duckdb
+import pyarrow as pa
 import pyarrow.parquet as pq
+from build_data import JOINED_FILE, build_joined
+
+# Copy-on-Write: column reassignments and derived frames, here and in
+# build_joined, share buffers instead of defensive copies. Always on (and the
+# option deprecated) from pandas 3.0.
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+# --- Load Data ---
+# Columns shown for the selected age group; SQL queries go through DuckDB
+# and see them all
+FILTER_COLUMNS = [
+    "fact_id", "subscribed", "subscribed_label", "age", "job", "marital", "education", "age_group",
+    "month", "duration", "duration_length", "campaign",
+]
+PREVIEW_COLS = ["fact_id", "age", "job", "education", "age_group", "subscribed"]
+PREVIEW_ROWS = 5
+FILTER_ROW_LIMIT = 1000
+MONTH_ORDER = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
 
-# --- Load and Join Data ---
 @st.cache_data
-def load_data():
-    fact = pd.read_parquet("marketing.parquet")
-    client = pd.read_parquet("client.parquet")
-    contact = pd.read_parquet("contact.parquet")
-    campaign = pd.read_parquet("campaign.parquet")
-    
-    # Join all tables into one dataframe
-    df = (
-        fact.merge(client, on="fact_id", how="left")
-            .merge(contact, on="fact_id", how="left")
-            .merge(campaign, on="fact_id", how="left")
-    )
-    return df
+def load_preview(version):
+    # First rows of the joined file for the data preview; only the preview
+    # columns of a single small batch are decoded
+    batches = pq.ParquetFile(JOINED_FILE).iter_batches(batch_size=PREVIEW_ROWS, columns=PREVIEW_COLS)
+    return next(batches).to_pandas()
+
+# --- SQL Engine ---
+@st.cache_resource(max_entries=1)
+def get_connection(version):
+    # DuckDB in-memory database holding the joined table, loaded once per
+    # joined.parquet version and shared by every query. Rows keep the file's
+    # order, which build_data.py already clusters on age_group.
+    con = duckdb.connect(":memory:")
+    con.execute(f"CREATE TABLE data AS SELECT * FROM read_parquet('{JOINED_FILE}')")
+    # The SQL box runs arbitrary queries: once the table is loaded, cut off
+    # file and network access (read_text, COPY ... TO, ATTACH) and stop
+    # queries from turning it back on
+    con.execute("SET enable_external_access = false")
+    con.execute("SET lock_configuration = true")
+    return con
+
+def run_query(query, version, params=None):
+    # 'version' is the joined file's mtime, checked once per script run.
+    # Each call gets its own cursor so concurrent sessions don't share state
+    return get_connection(version).cursor().execute(query, params).fetch_df()
 
 # --- SQL Execution Function ---
-@st.cache_data
-def execute_sql(query, data):
+@st.cache_data(show_spinner=False, max_entries=64)
+def execute_sql(query, version):
     try:
-        # Using SQLite to run queries on the dataframe
-        con = sqlite3.connect(":memory:")  # SQLite in-memory database
-        data.to_sql('data', con, index=False, if_exists='replace')
-        result = pd.read_sql(query, con)
-        con.close()
-        return result
+        return run_query(query, version)
     except Exception as e:
         st.error(f"Error: {e}")
         return pd.DataFrame()
-        
-data = load_data()
 
-# Sidebar for navigation
-st.sidebar.title("Navigation")
-page = st.sidebar.radio("Select a Page", ["Exploratory Data Analysis", "SQL Query Interface", "GenAI Assistant"])
+# --- Natural Language to SQL (basic example) ---
+# intent name -> (phrase pattern, SQL template)
+_INTENTS = {
+    "avg_rate_by_age_group": (
+        r"average subscription rate by age group",
+        "SELECT age_group, AVG(subscribed::INT) AS avg_subscription_rate FROM data GROUP BY age_group",
+    ),
+    "total_subscriptions": (
+        r"total subscriptions",
+        "SELECT COUNT(*) AS total_subscriptions FROM data WHERE subscribed = 1",
+    ),
+}
+# All intents in one alternation, so a query is matched in a single scan
+_INTENT_PATTERN = re.compile(
+    "|".join(f"(?P<{name}>{pattern})" for name, (pattern, _) in _INTENTS.items()), re.I
+)
+# Table position of each intent; earlier intents win when several phrases appear
+_INTENT_RANK = {name: rank for rank, name in enumerate(_INTENTS)}
+DEFAULT_SQL = "SELECT * FROM data LIMIT 10;"  # Default query for unknown input
+
+def nl_to_sql(nl_query):
+    matched = [match.lastgroup for match in _INTENT_PATTERN.finditer(nl_query)]
+    return _INTENTS[min(matched, key=_INTENT_RANK.get)][1] if matched else DEFAULT_SQL
+
+def to_csv_bytes(df):
+    # Encoded once, so the download button is handed bytes rather than a str
+    return df.to_csv(index=False).encode()
+
+def to_parquet_bytes(df):
+    # zstd-compressed Parquet, much smaller than CSV for large results
+    buf = pa.BufferOutputStream()
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), buf, compression="zstd")
+    return buf.getvalue().to_pybytes()
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def query_downloads(query, version, _result):
+    # CSV and Parquet payloads for a query's result, encoded once per query
+    # rather than on every rerun of the page. The result frame itself isn't
+    # hashed; the query and data version identify it.
+    return to_csv_bytes(_result), to_parquet_bytes(_result)
+
+# --- EDA Aggregations (memoized across reruns) ---
+# Cached results take the joined file's version so a rebuilt file is
+# never answered from stale entries.
+SUMMARY_COLUMNS = ["age", "duration", "campaign"]
 
-# --- Page 1: Exploratory Data Analysis ---
-if page == "Exploratory Data Analysis":
-    st.title("Exploratory Data Analysis (EDA)")
+@st.cache_data
+def summary_statistics(version):
+    return run_query(f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM data", version).describe()
 
-    # Display the raw data preview
-    st.subheader("Data Preview")
-    st.dataframe(data.head())
+GROUP_COLUMNS = ["age_group", "subscribed_label", "month", "education", "job"]
 
-    # Show the summary statistics
-    st.subheader("Summary Statistics")
-    st.write(data.describe())
+@st.cache_data
+def grouped_stats(version):
+    # Row count and subscription rate per value of every charted column,
+    # computed together in a single scan with GROUPING SETS
+    dimension = " ".join(f"WHEN GROUPING({c}) = 0 THEN '{c}'" for c in GROUP_COLUMNS)
+    return run_query(f"""
+        SELECT
+            CASE {dimension} END AS dimension,
+            COALESCE({', '.join(GROUP_COLUMNS)}) AS value,
+            COUNT(*) AS Count,
+            AVG(subscribed::INT) * 100 AS "Subscription Rate (%)"
+        FROM data
+        GROUP BY GROUPING SETS ({', '.join(f'({c})' for c in GROUP_COLUMNS)})
+    """, version)
+
+def column_stats(column, version):
+    stats = grouped_stats(version)
+    stats = stats[(stats['dimension'] == column) & stats['value'].notna()]
+    return stats.drop(columns='dimension').rename(columns={'value': column})
+
+def age_group_counts(version):
+    counts = column_stats('age_group', version)[['age_group', 'Count']]
+    return counts.rename(columns={'age_group': 'Age Group'}).sort_values('Count', ascending=False)
+
+def subscription_counts(version):
+    counts = column_stats('subscribed_label', version)[['subscribed_label', 'Count']]
+    return counts.rename(columns={'subscribed_label': 'Subscribed'}).sort_values('Count', ascending=False)
+
+@st.cache_data
+def duration_box_stats(version):
+    # Box plot statistics per outcome, so only a few numbers reach the browser
+    return run_query("""
+        WITH q AS (
+            SELECT subscribed_label,
+                   quantile_cont(duration, 0.25) AS q1,
+                   median(duration) AS median,
+                   quantile_cont(duration, 0.75) AS q3
+            FROM data
+            GROUP BY subscribed_label
+        )
+        SELECT q.subscribed_label, q1, median, q3,
+               MIN(d.duration) FILTER (WHERE d.duration >= q1 - 1.5 * (q3 - q1)) AS lowerfence,
+               MAX(d.duration) FILTER (WHERE d.duration <= q3 + 1.5 * (q3 - q1)) AS upperfence
+        FROM q
+        JOIN data d ON d.subscribed_label = q.subscribed_label
+        GROUP BY q.subscribed_label, q1, median, q3
+        ORDER BY q.subscribed_label
+    """, version)
+
+def month_counts(version):
+    counts = column_stats('month', version)[['month', 'Count']]
+    # Calendar order from an ordered categorical; the sort only compares codes
+    counts['month'] = pd.Categorical(counts['month'], categories=MONTH_ORDER, ordered=True)
+    return counts.rename(columns={'month': 'Month'}).sort_values('Month')
+
+def subscription_rate(column, version):
+    # Subscription rate (%) per value of a column, e.g. 'job' or 'education'
+    return column_stats(column, version)[[column, 'Subscription Rate (%)']].sort_values(column)
+
+# --- EDA Figures (built once, reused across reruns) ---
+@st.cache_data
+def eda_figures(version):
+    # Plotly is only needed for the charts on the EDA page
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    figs = {}
 
-    # Visualizations
     # 1. Age group distribution
-    age_group_count = data['age_group'].value_counts().reset_index()
-    age_group_count.columns = ['Age Group', 'Count']
-    fig = px.bar(age_group_count, x='Age Group', y='Count', title="Age Group Distribution")
-    st.plotly_chart(fig)
+    age_group_count = age_group_counts(version)
+    figs['age_group_distribution'] = px.bar(age_group_count, x='Age Group', y='Count', title="Age Group Distribution")
 
     # 2. Campaign subscription analysis
-    campaign_subscribed = data['subscribed'].value_counts().reset_index()
-    campaign_subscribed.columns = ['Subscribed', 'Count']
-    fig = px.pie(campaign_subscribed, names='Subscribed', values='Count', title="Subscription Distribution")
-    st.plotly_chart(fig)
+    campaign_subscribed = subscription_counts(version)
+    figs['subscription_distribution'] = px.pie(campaign_subscribed, names='Subscribed', values='Count', title="Subscription Distribution")
 
     # 3. Contact Duration vs Outcome
-    fig = px.box(
-        data, 
-        x='subscribed', 
-        y='duration_length', 
+    box_stats = duration_box_stats(version)
+    fig = go.Figure(go.Box(
+        x=box_stats['subscribed_label'],
+        q1=box_stats['q1'],
+        median=box_stats['median'],
+        q3=box_stats['q3'],
+        lowerfence=box_stats['lowerfence'],
+        upperfence=box_stats['upperfence'],
+    ))
+    fig.update_layout(
         title="Contact Duration vs Subscription Outcome",
-        labels={'subscribed': 'Subscribed', 'duration_length': 'Contact Duration'}
+        xaxis_title='Subscribed',
+        yaxis_title='Contact Duration'
     )
-    st.plotly_chart(fig)
+    figs['duration_vs_outcome'] = fig
 
     # 4. Contact Month Distribution
-    st.subheader("Contact Month Distribution")
-    month_count = data['month'].value_counts().sort_index().reset_index()
-    month_count.columns = ['Month', 'Count']
-    fig = px.bar(month_count, x='Month', y='Count', title="Contact Month Distribution")
-    st.plotly_chart(fig)
-    
-    # 5. Subscription by Education
-    st.subheader("Subscription Rate by Education Level")
-
-    # Ensure 'subscribed' is boolean (if not already)
-    data['subscribed'] = data['subscribed'].astype(bool)
-
-    # Group and calculate subscription rate
-    edu_group = data.groupby('education')['subscribed'].mean().reset_index()
-    edu_group["Subscription Rate (%)"] = edu_group["subscribed"] * 100
+    month_count = month_counts(version)
+    figs['month_distribution'] = px.bar(month_count, x='Month', y='Count', title="Contact Month Distribution")
 
-    # Plot the results
-    fig = px.bar(
+    # 5. Subscription by Education
+    edu_group = subscription_rate('education', version)
+    figs['rate_by_education'] = px.bar(
         edu_group,
         x='education',
         y='Subscription Rate (%)',
         title="Subscription Rate by Education Level"
     )
-    st.plotly_chart(fig)
 
     # 6. Subscription Rate by Age Group
-    st.subheader("Subscription Rate by Age Group")
-
-    # Ensure 'subscribed' is boolean
-    data['subscribed'] = data['subscribed'].astype(bool)
-
-    # Calculate subscription rate
-    age_group = data.groupby('age_group')['subscribed'].mean().reset_index()
-    age_group["Subscription Rate (%)"] = age_group["subscribed"] * 100
-
-    # Pie Chart
-    fig = px.pie(
+    age_group = subscription_rate('age_group', version)
+    figs['rate_by_age_group'] = px.pie(
         age_group,
         names='age_group',
         values='Subscription Rate (%)',
         title='Subscription Rate by Age Group'
     )
-    st.plotly_chart(fig)
 
     # 7. Subscription Rate by Job
-    st.subheader("Subscription Rate by Job (Bar Chart)")
-
-    # Ensure 'subscribed' is boolean
-    data['subscribed'] = data['subscribed'].astype(bool)
-
-    # Calculate subscription rate
-    job_group = data.groupby('job')['subscribed'].mean().reset_index()
-    job_group["Subscription Rate (%)"] = job_group["subscribed"] * 100
-
-    # Bar Chart
-    fig = px.bar(
-        job_group.sort_values("Subscription Rate (%)", ascending=True),
+    job_group = subscription_rate('job', version)
+    job_group = job_group.iloc[np.argsort(job_group["Subscription Rate (%)"].to_numpy())]
+    figs['rate_by_job'] = px.bar(
+        job_group,
         x='Subscription Rate (%)',
         y='job',
         orientation='h',
         title='Subscription Rate by Job',
-        labels={'job': 'Job', 'Subscription Rate (%)': 'Subscription Rate (%)'}
+        labels={'job': 'Job', 'Subscription Rate (%)': 'Subscription Rate (%)'},
+        # Listed top to bottom, so the highest rate sits at the top
+        category_orders={'job': job_group['job'].tolist()[::-1]}
     )
-    st.plotly_chart(fig)
+    return figs
+
+@st.cache_data
+def age_group_rows(age_group, version):
+    # The filter is pushed into the Parquet reader, which skips row groups
+    # whose age_group statistics exclude the value. Returns the group's
+    # row count and its first FILTER_ROW_LIMIT rows.
+    table = pq.read_table(JOINED_FILE, columns=FILTER_COLUMNS, filters=[("age_group", "=", age_group)])
+    return table.num_rows, table.slice(0, FILTER_ROW_LIMIT).to_pandas()
+        
+joined_version = build_joined()
+preview = load_preview(joined_version)
+
+# Sidebar for navigation
+st.sidebar.title("Navigation")
+page = st.sidebar.radio("Select a Page", ["Exploratory Data Analysis", "SQL Query Interface", "GenAI Assistant"])
+
+# --- Page 1: Exploratory Data Analysis ---
+if page == "Exploratory Data Analysis":
+    st.title("Exploratory Data Analysis (EDA)")
+
+    # Display the raw data preview
+    st.subheader("Data Preview")
+    st.dataframe(preview)
+
+    # Show the summary statistics
+    st.subheader("Summary Statistics")
+    st.write(summary_statistics(joined_version))
+
+    # Visualizations
+    figs = eda_figures(joined_version)
+
+    # 1. Age group distribution
+    st.plotly_chart(figs['age_group_distribution'])
+
+    # 2. Campaign subscription analysis
+    st.plotly_chart(figs['subscription_distribution'])
+
+    # 3. Contact Duration vs Outcome
+    st.plotly_chart(figs['duration_vs_outcome'])
+
+    # 4. Contact Month Distribution
+    st.subheader("Contact Month Distribution")
+    st.plotly_chart(figs['month_distribution'])
+    
+    # 5. Subscription by Education
+    st.subheader("Subscription Rate by Education Level")
+    st.plotly_chart(figs['rate_by_education'])
+
+    # 6. Subscription Rate by Age Group
+    st.subheader("Subscription Rate by Age Group")
+    st.plotly_chart(figs['rate_by_age_group'])
+
+    # 7. Subscription Rate by Job
+    st.subheader("Subscription Rate by Job (Bar Chart)")
+    st.plotly_chart(figs['rate_by_job'])
     
     # Filters to dynamically update the data
-    age_group_filter = st.selectbox('Select Age Group:', data['age_group'].unique())
-    filtered_data = data[data['age_group'] == age_group_filter]
+    age_group_filter = st.selectbox('Select Age Group:', sorted(column_stats('age_group', joined_version)['age_group']))
+    total_rows, filtered_data = age_group_rows(age_group_filter, joined_version)
     st.subheader(f"Filtered Data - Age Group: {age_group_filter}")
-    st.write(filtered_data)
+    st.dataframe(filtered_data)
+    st.caption(f"Showing {len(filtered_data):,} of {total_rows:,} rows")
 
     st.subheader("Key Insights")
     st.markdown("""
@@ -187,34 +344,26 @@ elif page == "SQL Query Interface":
     # Text box to enter SQL query
     query = st.text_area("Enter SQL Query", value="SELECT * FROM data LIMIT 10;", height=200)
 
-    # Execute the SQL query
-    @st.cache_data
-    def execute_sql(query):
-        try:
-            # Using SQLite to run queries on the dataframe
-            con = sqlite3.connect(":memory:")  # SQLite in-memory database
-            data.to_sql('data', con, index=False, if_exists='replace')
-            result = pd.read_sql(query, con)
-            con.close()
-            return result
-        except Exception as e:
-            st.error(f"Error: {e}")
-            return pd.DataFrame()
-
     # Display query results
     if query:
-        result_data = execute_sql(query)
+        result_data = execute_sql(query, joined_version)
         st.subheader("Query Result Preview")
         st.dataframe(result_data.head())
 
-        # Option to export data as CSV
-        csv_data = result_data.to_csv(index=False)
+        # Option to export data as CSV or Parquet
+        csv_data, parquet_data = query_downloads(query, joined_version, result_data)
         st.download_button(
             label="Download CSV",
             data=csv_data,
             file_name="query_result.csv",
             mime="text/csv"
         )
+        st.download_button(
+            label="Download Parquet",
+            data=parquet_data,
+            file_name="query_result.parquet",
+            mime="application/vnd.apache.parquet"
+        )
 
 # --- Page 3: GenAI Assistant (Text-to-SQL Generator) ---
 elif page == "GenAI Assistant":
@@ -224,15 +373,6 @@ elif page == "GenAI Assistant":
     nl_query = st.text_area("Enter your natural language query", height=200, placeholder="e.g., Show me the average subscription rate by age group.")
 
     if nl_query:
-        # Simple function to convert natural language to SQL (basic example)
-        def nl_to_sql(nl_query):
-            if "average subscription rate by age group" in nl_query.lower():
-                return "SELECT age_group, AVG(subscribed) AS avg_subscription_rate FROM data GROUP BY age_group"
-            elif "total subscriptions" in nl_query.lower():
-                return "SELECT COUNT(*) AS total_subscriptions FROM data WHERE subscribed = 1"
-            else:
-                return "SELECT * FROM data LIMIT 10;"  # Default query for unknown input
-
         # Convert NL query to SQL
         sql_query = nl_to_sql(nl_query)
         st.subheader("Generated SQL Query")
@@ -242,15 +382,21 @@ elif page == "GenAI Assistant":
         execute_button = st.button("Execute Query")
 
         if execute_button:
-            result_data = execute_sql(sql_query, data)
+            result_data = execute_sql(sql_query, joined_version)
             st.subheader("Query Result Preview")
             st.dataframe(result_data.head())
 
-            # Option to export data as CSV
-            csv_data = result_data.to_csv(index=False)
+            # Option to export data as CSV or Parquet
+            csv_data, parquet_data = query_downloads(sql_query, joined_version, result_data)
             st.download_button(
                 label="Download CSV",
                 data=csv_data,
                 file_name="query_result_from_nl.csv",
                 mime="text/csv"
             )
+            st.download_button(
+                label="Download Parquet",
+                data=parquet_data,
+                file_name="query_result_from_nl.parquet",
+                mime="application/vnd.apache.parquet"
+            )